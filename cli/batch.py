@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import html
+import queue
+import multiprocessing
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import click
+from config import read_config
+from query_filters import check_filter_spec
+
+# settings that can be given in `defaults`, on a PCE or on a single org;
+# the most specific one wins
+JOB_SETTINGS = {
+	'start': '30 days ago',
+	'end': 'today',
+	'limit': 2000,
+	'format': 'html',
+	'top_n': 10,
+	'direction': 'LR',
+	'views': ['top_talkers', 'top_destinations', 'top_ports', 'ip_protocol_treemap'],
+	'shard_days': 0,
+	'checkpoint_dir': None,
+	'retries': 5,
+	'filters': None,
+}
+
+def _credential(pce, key):
+	# keep secrets out of the manifest by naming an environment variable instead
+	if key in pce:
+		return pce[key]
+	env_name = pce.get(key + '_env')
+	if env_name and env_name in os.environ:
+		return os.environ[env_name]
+	raise click.ClickException(f"PCE {pce['name']}: set {key} or {key}_env")
+
+def _settings(*layers):
+	settings = dict(JOB_SETTINGS)
+	for layer in layers:
+		settings.update({k: v for k, v in layer.items() if k in JOB_SETTINGS})
+	return settings
+
+def load_jobs(manifest, output_dir, known_views):
+	defaults = manifest.get('defaults', {})
+	jobs = []
+	limits = {}
+	for pce in manifest.get('pces', []):
+		if 'host' not in pce:
+			raise click.ClickException("Every PCE in the manifest needs a host")
+		pce.setdefault('name', pce['host'])
+		if pce['name'] in limits:
+			raise click.ClickException(f"PCE {pce['name']} is listed twice, give one of them a different name")
+		max_concurrency = pce.get('max_concurrency', 2)
+		if not isinstance(max_concurrency, int) or max_concurrency < 1:
+			raise click.ClickException(f"PCE {pce['name']}: max_concurrency must be an integer of at least 1")
+		limits[pce['name']] = max_concurrency
+		org_names = set()
+		for org in pce.get('orgs', [1]):
+			org = org if isinstance(org, dict) else {'org_id': org}
+			if 'org_id' not in org:
+				raise click.ClickException(f"PCE {pce['name']}: every org needs an org_id")
+			settings = _settings(defaults, pce, org)
+			unknown = set(settings['views']) - set(known_views)
+			if unknown:
+				raise click.ClickException(f"Unknown views in manifest: {', '.join(sorted(unknown))}")
+			org_name = org.get('name', f"org{org['org_id']}")
+			if org_name in org_names:
+				# the output directory and the scheduler are keyed on (pce, org)
+				raise click.ClickException(f"PCE {pce['name']}: org {org_name} is listed twice")
+			org_names.add(org_name)
+			if settings['filters'] is not None:
+				check_filter_spec(settings['filters'], f"Filters for {pce['name']}/{org_name}")
+			jobs.append({
+				'pce': pce['name'],
+				'org': org_name,
+				'pce_host': pce['host'],
+				'port': int(pce.get('port', 8443)),
+				'org_id': org['org_id'],
+				'api_key': _credential(pce, 'api_key'),
+				'api_secret': _credential(pce, 'api_secret'),
+				'output_dir': os.path.join(output_dir, pce['name'], org_name),
+				**settings
+			})
+	if not jobs:
+		raise click.ClickException("The manifest does not list any PCEs")
+	return jobs, limits
+
+def run_jobs(jobs, limits, worker, workers):
+	"""Run jobs on a process pool, keeping at most limits[pce] fetches in flight per PCE.
+
+	Workers put (pce, org) on job['fetch_done'] once their fetch is over, which
+	frees the PCE's slot while the job goes on rendering.
+	"""
+	pending = defaultdict(deque)
+	for job in jobs:
+		pending[job['pce']].append(job)
+	in_flight = defaultdict(int)
+	fetching = set()
+	futures = {}
+	results = []
+
+	def release(pce, org):
+		if (pce, org) in fetching:
+			fetching.remove((pce, org))
+			in_flight[pce] -= 1
+
+	with multiprocessing.Manager() as manager, ProcessPoolExecutor(max_workers=workers) as pool:
+		fetch_done = manager.Queue()
+
+		def submit_ready():
+			for pce, jobs_left in pending.items():
+				while jobs_left and in_flight[pce] < limits.get(pce, 1):
+					job = jobs_left.popleft()
+					futures[pool.submit(worker, {**job, 'fetch_done': fetch_done})] = job
+					fetching.add((pce, job['org']))
+					in_flight[pce] += 1
+
+		submit_ready()
+		while futures:
+			done, _ = wait(futures, timeout=0.2, return_when=FIRST_COMPLETED)
+			while True:
+				try:
+					release(*fetch_done.get_nowait())
+				except queue.Empty:
+					break
+			for future in done:
+				job = futures.pop(future)
+				release(job['pce'], job['org'])
+				try:
+					result = future.result()
+				except Exception as e:
+					# the worker reports its own errors, this only catches a dead process
+					result = {'pce': job['pce'], 'org': job['org'], 'error': str(e), 'outputs': [], 'errors': []}
+				status = f"failed: {result['error']}" if result.get('error') else f"{len(result['outputs'])} outputs"
+				if result.get('errors'):
+					status += f", {len(result['errors'])} render error(s)"
+				click.echo(f"[{result['pce']}/{result['org']}] {status}")
+				results.append(result)
+			submit_ready()
+
+	order = {(job['pce'], job['org']): i for i, job in enumerate(jobs)}
+	return sorted(results, key=lambda r: order[(r['pce'], r['org'])])
+
+def write_index(output_dir, results, elapsed):
+	os.makedirs(output_dir, exist_ok=True)
+	with open(os.path.join(output_dir, 'index.json'), 'w') as f:
+		json.dump({'elapsed_seconds': round(elapsed, 2), 'runs': results}, f, indent=2)
+
+	rows = []
+	for r in results:
+		links = ' '.join(
+			f'<a href="{html.escape(os.path.relpath(path, output_dir))}">{html.escape(view)}</a>'
+			for view, path in r['outputs']
+		)
+		errors = '<br>'.join(html.escape(e) for e in [r.get('error')] + r.get('errors', []) if e)
+		rows.append(
+			f"<tr><td>{html.escape(r['pce'])}</td><td>{html.escape(r['org'])}</td>"
+			f"<td>{r.get('flows', '')}</td><td>{r.get('fetch_seconds', '')}</td><td>{r.get('render_seconds', '')}</td>"
+			f"<td>{links}</td><td>{errors}</td></tr>"
+		)
+	with open(os.path.join(output_dir, 'index.html'), 'w') as f:
+		f.write(
+			"<!DOCTYPE html><html><head><meta charset=\"UTF-8\"><title>dpndr batch</title></head><body>"
+			f"<h1>dpndr batch ({elapsed:.1f}s)</h1><table border=\"1\">"
+			"<tr><th>PCE</th><th>Org</th><th>Flows</th><th>Fetch (s)</th><th>Render (s)</th><th>Outputs</th><th>Errors</th></tr>"
+			+ ''.join(rows) + "</table></body></html>"
+		)
+
+def run_batch(manifest_path, worker, known_views, output_dir=None, workers=None):
+	manifest = read_config(manifest_path)
+	output_dir = output_dir or manifest.get('output_dir', 'batch_output')
+	workers = workers or manifest.get('workers') or os.cpu_count()
+	jobs, limits = load_jobs(manifest, output_dir, known_views)
+
+	click.echo(f"Running {len(jobs)} org(s) on {workers} worker(s)")
+	started = time.perf_counter()
+	results = run_jobs(jobs, limits, worker, workers)
+	write_index(output_dir, results, time.perf_counter() - started)
+	return results
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import time
+import random
+import click
+import pandas as pd
+from flowstore import FlowStore
+
+def fresh(s):
+	# JSON decoding gives every flow its own string objects, mimic that
+	return s.encode().decode() if s is not None else None
+
+def synthetic_records(n, seed=0):
+	rng = random.Random(seed)
+	ips = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(5000)]
+	hosts = {ip: f"host-{i:05d}.corp.example.com" for i, ip in enumerate(ips)}
+	apps = [f"app-{i}" for i in range(200)]
+	envs = ['prod', 'staging', 'dev', 'test']
+	locs = ['emea', 'amer', 'apac']
+	roles = ['web', 'db', 'app', 'cache', 'queue']
+	processes = [f"process-{i}" for i in range(50)]
+	ports = [22, 80, 443, 3306, 5432, 6379, 8080, 8443, 9200] + list(range(30000, 30100))
+
+	for _ in range(n):
+		src, dst = rng.choice(ips), rng.choice(ips)
+		yield {
+			'src_ip': fresh(src),
+			'src_hostname': fresh(hosts[src]),
+			'dst_ip': fresh(dst),
+			'dst_hostname': fresh(hosts[dst]),
+			'proto': 6,
+			'port': rng.choice(ports),
+			'process_name': fresh(rng.choice(processes)),
+			'service_name': None,
+			'user_name': fresh('root'),
+			'windows_service_name': None,
+			'policy_decision': fresh(rng.choice(['allowed', 'potentially_blocked'])),
+			'flow_direction': fresh(rng.choice(['inbound', 'outbound'])),
+			'num_connections': rng.randint(1, 5000),
+			'first_detected': fresh('2024-07-01T10:%02d:%02dZ' % (rng.randint(0, 59), rng.randint(0, 59))),
+			'last_detected': fresh('2024-07-30T18:%02d:%02dZ' % (rng.randint(0, 59), rng.randint(0, 59))),
+			'src_app': fresh(rng.choice(apps)),
+			'src_env': fresh(rng.choice(envs)),
+			'src_loc': fresh(rng.choice(locs)),
+			'src_role': fresh(rng.choice(roles)),
+			'dst_app': fresh(rng.choice(apps)),
+			'dst_env': fresh(rng.choice(envs)),
+			'dst_loc': fresh(rng.choice(locs)),
+			'dst_role': fresh(rng.choice(roles)),
+		}
+
+def mb(n):
+	return f"{n / 2**20:,.1f} MB"
+
+@click.command()
+@click.option('--flows', type=int, default=200000, help='Number of synthetic flows')
+def bench(flows):
+	"""Compare memory of the object-string flow frame with the compact FlowStore."""
+	df = pd.DataFrame(list(synthetic_records(flows)))
+	baseline = df.memory_usage(deep=True).sum()
+
+	started = time.perf_counter()
+	store = FlowStore.from_dataframe(df)
+	encode_seconds = time.perf_counter() - started
+	del df
+
+	started = time.perf_counter()
+	decoded = store.to_dataframe()
+	decode_seconds = time.perf_counter() - started
+	# deep=True would count a shared interned string once per cell, so count the pointers plus the table
+	decoded_size = decoded.memory_usage(deep=False).sum() + store.table.nbytes
+
+	click.echo(f"flows:                 {flows:,}")
+	click.echo(f"object-string frame:   {mb(baseline)}")
+	click.echo(f"FlowStore:             {mb(store.nbytes)} ({baseline / store.nbytes:.1f}x smaller, encoded in {encode_seconds:.2f}s)")
+	click.echo(f"decoded frame:         {mb(decoded_size)} ({baseline / decoded_size:.1f}x smaller, decoded in {decode_seconds:.2f}s)")
+
+if __name__ == '__main__':
+	bench()
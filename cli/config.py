@@ -0,0 +1,13 @@
+import json
+import click
+
+def read_config(path):
+	"""Load a YAML or JSON file; YAML needs PyYAML."""
+	with open(path) as f:
+		if path.endswith(('.yaml', '.yml')):
+			try:
+				import yaml
+			except ImportError:
+				raise click.ClickException(f"{path}: YAML files need PyYAML (pip install pyyaml); use JSON otherwise")
+			return yaml.safe_load(f) or {}
+		return json.load(f)
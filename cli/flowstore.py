@@ -0,0 +1,193 @@
+import sys
+import ipaddress
+import numpy as np
+import pandas as pd
+
+IP_COLUMNS = ('src_ip', 'dst_ip')
+INT_COLUMNS = {'port': np.uint16, 'proto': np.uint8, 'num_connections': np.uint32}
+TIME_COLUMNS = ('first_detected', 'last_detected')
+
+class StringTable:
+	"""Intern table shared by every string column of a FlowStore; columns hold int32 codes into it."""
+
+	def __init__(self):
+		self.strings = []
+		self.codes = {}
+
+	def intern(self, value):
+		code = self.codes.get(value)
+		if code is None:
+			code = self.codes[value] = len(self.strings)
+			self.strings.append(value)
+		return code
+
+	def encode(self, values):
+		codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+		mapping = np.array([self.intern(v) for v in uniques] + [-1], dtype=np.int32)
+		# factorize marks missing values with -1, which picks the trailing -1 of the mapping
+		return mapping[codes]
+
+	def decode(self, codes):
+		values = np.empty(len(self.strings) + 1, dtype=object)
+		values[:-1] = self.strings
+		values[-1] = None
+		return values[codes]
+
+	@property
+	def nbytes(self):
+		return (sum(sys.getsizeof(s) for s in self.strings)
+				+ sys.getsizeof(self.strings) + sys.getsizeof(self.codes))
+
+def pack_ips(values):
+	"""Pack IP strings into uint32, or into (n, 2) uint64 hi/lo words if any IPv6 is present.
+
+	Returns the packed array, the missing mask and, for the IPv6 layout, a
+	per-row flag marking the IPv4 addresses that were mapped into it.
+	"""
+	codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+	addresses = [ipaddress.ip_address(v) for v in uniques]
+	missing = codes < 0
+	missing = missing if missing.any() else None
+	if all(a.version == 4 for a in addresses):
+		packed = np.array([int(a) for a in addresses] + [0], dtype=np.uint32)
+		return packed[codes], missing, None
+	ints = [int(a) if a.version == 6 else int(ipaddress.IPv6Address(b'\0' * 10 + b'\xff\xff' + a.packed)) for a in addresses]
+	packed = np.array([(i >> 64, i & 0xFFFFFFFFFFFFFFFF) for i in ints] + [(0, 0)], dtype=np.uint64)
+	is_v4 = np.array([a.version == 4 for a in addresses] + [False])
+	return packed[codes], missing, is_v4[codes]
+
+def format_times(values):
+	"""Format datetime64[ms] values back into the PCE's ISO strings, e.g. 2024-07-01T00:00:00Z."""
+	uniques, inverse = np.unique(values, return_inverse=True)
+	strings = np.datetime_as_string(uniques, unit='ms').astype(object)
+	strings = np.array([None if t == 'NaT' else t.removesuffix('.000') + 'Z' for t in strings], dtype=object)
+	return strings[inverse.reshape(-1)]
+
+def unpack_ips(packed, missing=None, is_v4=None):
+	if packed.ndim == 1:
+		uniques, inverse = np.unique(packed, return_inverse=True)
+		result = np.array([str(ipaddress.IPv4Address(int(v))) for v in uniques], dtype=object)[inverse.reshape(-1)]
+	else:
+		uniques, inverse = np.unique(packed, axis=0, return_inverse=True)
+		inverse = inverse.reshape(-1)
+		addresses = [ipaddress.IPv6Address((int(hi) << 64) | int(lo)) for hi, lo in uniques]
+		# Python before 3.13 prints ::ffff:10.0.0.1 as ::ffff:a00:1, keep the dotted form the PCE sends
+		result = np.array([f"::ffff:{a.ipv4_mapped}" if a.ipv4_mapped else str(a) for a in addresses], dtype=object)[inverse]
+		# only rows that were IPv4 go back to dotted quads, a real ::ffff:a.b.c.d stays IPv6
+		if is_v4 is not None and is_v4.any():
+			v4 = np.array([str(a.ipv4_mapped or a) for a in addresses], dtype=object)
+			result[is_v4] = v4[inverse[is_v4]]
+	if missing is not None:
+		result[missing] = None
+	return result
+
+class FlowStore:
+	"""Columnar, memory-compact copy of the flow table built by to_dataframe.
+
+	IPs are packed integers, port/proto/num_connections narrow unsigned ints
+	and every other string column (hostnames, process names, labels, ...)
+	int32 codes into one shared StringTable. Missing values are tracked in
+	boolean masks, only for the columns that have any.
+	"""
+
+	def __init__(self):
+		self.table = StringTable()
+		self.columns = {}
+		self.missing = {}
+		self.ipv4 = {}
+
+	def __len__(self):
+		return len(next(iter(self.columns.values()))) if self.columns else 0
+
+	@classmethod
+	def from_columns(cls, columns):
+		store = cls()
+		for name, values in columns.items():
+			if name in IP_COLUMNS:
+				store.columns[name], missing, is_v4 = pack_ips(values)
+				if is_v4 is not None:
+					store.ipv4[name] = is_v4
+			elif name in INT_COLUMNS:
+				numbers = pd.to_numeric(pd.Series(values), errors='coerce')
+				missing = numbers.isna().to_numpy()
+				store.columns[name] = numbers.fillna(0).to_numpy().astype(INT_COLUMNS[name])
+				missing = missing if missing.any() else None
+			elif name in TIME_COLUMNS:
+				times = pd.to_datetime(pd.Series(values), utc=True, format='ISO8601')
+				store.columns[name] = times.dt.tz_localize(None).to_numpy().astype('datetime64[ms]')
+				missing = None
+			else:
+				store.columns[name] = store.table.encode(values)
+				missing = None
+			if missing is not None:
+				store.missing[name] = missing
+		return store
+
+	@classmethod
+	def from_flows(cls, flows, label_href_map):
+		# gather references column by column; the strings themselves are owned by the flow objects
+		n = len(flows)
+		columns = {name: [None] * n for name in (
+			'src_ip', 'src_hostname', 'dst_ip', 'dst_hostname', 'proto', 'port',
+			'process_name', 'service_name', 'user_name', 'windows_service_name',
+			'policy_decision', 'flow_direction', 'num_connections', 'first_detected', 'last_detected'
+		)}
+		for i, flow in enumerate(flows):
+			columns['src_ip'][i] = flow.src.ip
+			columns['dst_ip'][i] = flow.dst.ip
+			columns['proto'][i] = flow.service.proto
+			columns['port'][i] = flow.service.port
+			columns['process_name'][i] = flow.service.process_name
+			columns['service_name'][i] = flow.service.service_name
+			columns['user_name'][i] = flow.service.user_name
+			columns['windows_service_name'][i] = flow.service.windows_service_name
+			columns['policy_decision'][i] = flow.policy_decision
+			columns['flow_direction'][i] = flow.flow_direction
+			columns['num_connections'][i] = flow.num_connections
+			columns['first_detected'][i] = flow.timestamp_range.first_detected
+			columns['last_detected'][i] = flow.timestamp_range.last_detected
+			for side, node in (('src', flow.src), ('dst', flow.dst)):
+				if node.workload is None:
+					continue
+				columns[side + '_hostname'][i] = node.workload.name
+				for l in node.workload.labels:
+					if l.href in label_href_map:
+						label = label_href_map[l.href]
+						name = side + '_' + label['key']
+						if name not in columns:
+							columns[name] = [None] * n
+						columns[name][i] = label['value']
+		return cls.from_columns(columns)
+
+	@classmethod
+	def from_dataframe(cls, df):
+		return cls.from_columns({name: df[name] for name in df.columns})
+
+	def to_dataframe(self, columns=None):
+		"""Decode into the frame the generate_* functions expect.
+
+		`columns` limits decoding to those columns, which is how the server
+		reads its resident store. String cells share the interned objects, so
+		the frame costs a pointer per cell rather than a string per cell.
+		Timestamps come back as ISO strings, like the PCE returns them.
+		"""
+		data = {}
+		for name in self.columns if columns is None else columns:
+			values = self.columns[name]
+			missing = self.missing.get(name)
+			if name in IP_COLUMNS:
+				data[name] = unpack_ips(values, missing, self.ipv4.get(name))
+			elif name in INT_COLUMNS:
+				data[name] = pd.arrays.IntegerArray(values, missing) if missing is not None else values
+			elif name in TIME_COLUMNS:
+				data[name] = format_times(values)
+			else:
+				data[name] = self.table.decode(values)
+		return pd.DataFrame(data)
+
+	@property
+	def nbytes(self):
+		return (sum(a.nbytes for a in self.columns.values())
+				+ sum(m.nbytes for m in self.missing.values())
+				+ sum(m.nbytes for m in self.ipv4.values())
+				+ self.table.nbytes)
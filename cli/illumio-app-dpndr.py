@@ -7,7 +7,7 @@ from functools import wraps
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from illumio import PolicyComputeEngine, TrafficQuery
+from illumio import PolicyComputeEngine
 from collections import defaultdict
 import plotly.graph_objects as go
 import plotly.express as px
@@ -19,20 +19,56 @@ matplotlib.use('Agg')  # Use non-interactive backend
 import pygraphviz as pgv
 import networkx as nx
 import io
+import time
+from pce_fetch import fetch_traffic_flows, with_retries, disable_session_retries
+from batch import run_batch
+from flowstore import FlowStore
+from query_filters import build_query_filters, filter_spec_from_options, POLICY_DECISIONS
+from server import run_server
+from mock_pce import MockPolicyComputeEngine
+
+def pce_options(required=True):
+	def decorator(f):
+		@click.option('--pce-host', envvar="ILLUMIO_PCE_HOST", required=required, help='PCE host')
+		@click.option('--port', envvar="ILLUMIO_PCE_PORT", required=required, type=int, help='PCE port')
+		@click.option('--org-id', envvar="ILLUMIO_PCE_ORG_ID", required=required, help='Organization ID')
+		@click.option('--api-key', envvar="ILLUMIO_PCE_API_KEY", required=required, help='API key')
+		@click.option('--api-secret', envvar="ILLUMIO_PCE_API_SECRET", required=required, help='API secret')
+		@wraps(f)
+		def wrapper(*args, **kwargs):
+			return f(*args, **kwargs)
+		return wrapper
+	return decorator
+
+def query_options(limit=2000):
+	def decorator(f):
+		@click.option('--start', default='30 days ago', help='Start date (YYYY-MM-DD or "X days ago")')
+		@click.option('--end', default='today', help='End date (YYYY-MM-DD or "X days ago")')
+		@click.option('--limit', type=int, default=limit, show_default=True, help='Maximum number of traffic flows to fetch (per shard with --shard-days)')
+		@click.option('--shard-days', type=int, default=0, help='Split the query into windows of this many days (0 = single query)')
+		@click.option('--checkpoint-dir', type=click.Path(file_okay=False), default=None, help='Save completed shards here and resume from them on the next run')
+		@click.option('--retries', type=click.IntRange(min=1), default=5, help='Attempts per PCE call before giving up')
+		@click.option('--profile', type=click.Path(exists=True, dir_okay=False), default=None, help='YAML/JSON query filter profile')
+		@click.option('--src', multiple=True, help='Include sources matching all of these comma-separated selectors (key=value, ipl:NAME, IP); repeat to OR')
+		@click.option('--dst', multiple=True, help='Include destinations matching all of these comma-separated selectors; repeat to OR')
+		@click.option('--exclude-src', multiple=True, help='Exclude sources matching any of these selectors')
+		@click.option('--exclude-dst', multiple=True, help='Exclude destinations matching any of these selectors')
+		@click.option('--service', multiple=True, help='Include services, e.g. 443/tcp, 8000-8100/tcp or icmp')
+		@click.option('--exclude-service', multiple=True, help='Exclude services, e.g. 22/tcp')
+		@click.option('--policy-decision', multiple=True, type=click.Choice(POLICY_DECISIONS), help='Policy decisions to fetch (default: allowed, potentially_blocked)')
+		@click.option('--no-default-excludes', is_flag=True, help='Do not exclude DNS, NetBIOS, UDP, broadcast and multicast traffic')
+		@wraps(f)
+		def wrapper(*args, **kwargs):
+			kwargs['filter_spec'] = filter_spec_from_options(**{name: kwargs.pop(name) for name in [
+				'profile', 'src', 'dst', 'exclude_src', 'exclude_dst', 'service', 'exclude_service',
+				'policy_decision', 'no_default_excludes'
+			]})
+			return f(*args, **kwargs)
+		return wrapper
+	return decorator
 
 def global_options(f):
-	@click.option('--pce-host', envvar="ILLUMIO_PCE_HOST", required=True, help='PCE host')
-	@click.option('--port', envvar="ILLUMIO_PCE_PORT", required=True, type=int, help='PCE port')
-	@click.option('--org-id', envvar="ILLUMIO_PCE_ORG_ID", required=True, help='Organization ID')
-	@click.option('--api-key', envvar="ILLUMIO_PCE_API_KEY", required=True, help='API key')
-	@click.option('--api-secret', envvar="ILLUMIO_PCE_API_SECRET", required=True, help='API secret')
-	@click.option('--start', default='30 days ago', help='Start date (YYYY-MM-DD or "X days ago")')
-	@click.option('--end', default='today', help='End date (YYYY-MM-DD or "X days ago")')
-	@click.option('--limit', type=int, default=2000, help='Maximum number of traffic flows to fetch')
-	@wraps(f)
-	def wrapper(*args, **kwargs):
-		return f(*args, **kwargs)
-	return wrapper
+	return pce_options()(query_options()(f))
 
 label_href_map = {}
 value_href_map = {}
@@ -45,53 +81,14 @@ def parse_date(date_string):
 		return datetime.now() - timedelta(days=days)
 	return datetime.strptime(date_string, "%Y-%m-%d")
 
-def traffic_flow_unique_name(flow):
-	return "{}-{}_{}-{}_{}".format(
-		flow.src.ip,
-		flow.dst.ip,
-		flow.service.port,
-		flow.service.proto,
-		flow.flow_direction
-	)
+def to_flow_store(flows):
+	global label_href_map
+
+	return FlowStore.from_flows(flows, label_href_map)
 
 def to_dataframe(flows):
-	global label_href_map
-	global value_href_map
-	
-	series_array = []
-	
-	for flow in flows:
-		f = {
-			'src_ip': flow.src.ip,
-			'src_hostname': flow.src.workload.name if flow.src.workload is not None else None,
-			'dst_ip': flow.dst.ip,
-			'dst_hostname': flow.dst.workload.name if flow.dst.workload is not None else None,
-			'proto': flow.service.proto,
-			'port': flow.service.port,
-			'process_name': flow.service.process_name,
-			'service_name': flow.service.service_name,
-			'user_name': flow.service.user_name,
-			'windows_service_name': flow.service.windows_service_name,
-			'policy_decision': flow.policy_decision,
-			'flow_direction': flow.flow_direction,
-			'num_connections': flow.num_connections,
-			'first_detected': flow.timestamp_range.first_detected,
-			'last_detected': flow.timestamp_range.last_detected
-		}
-		
-		if flow.src.workload:
-			for l in flow.src.workload.labels:
-				if l.href in label_href_map:
-					f['src_' + label_href_map[l.href]['key']] = label_href_map[l.href]['value']
-		
-		if flow.dst.workload:
-			for l in flow.dst.workload.labels:
-				if l.href in label_href_map:
-					f['dst_' + label_href_map[l.href]['key']] = label_href_map[l.href]['value']
-		
-		series_array.append(f)
-	
-	return pd.DataFrame(series_array)
+	# encode through the compact store so string cells share interned objects
+	return to_flow_store(flows).to_dataframe()
 
 def generate_top_x(df, column, n=10, title=""):
 	top_x = df[column].value_counts().nlargest(n)
@@ -270,12 +267,17 @@ def generate_graphviz_diagram(connections, output_format, direction):
 		buf.seek(0)
 		return buf.getvalue()
 
+_plotly_scope = None
+
 def export_plotly(fig, output_format):
+	global _plotly_scope
 	if output_format == 'html':
 		return fig.to_html(include_plotlyjs=True, full_html=True)
 	else:
-		scope = PlotlyScope()
-		img_bytes = scope.transform(fig, format=output_format)
+		# starting Kaleido is slow, keep one scope per process
+		if _plotly_scope is None:
+			_plotly_scope = PlotlyScope()
+		img_bytes = _plotly_scope.transform(fig, format=output_format)
 		return img_bytes
 
 def generate_app_env_treemap(df, column_prefix, title):
@@ -297,46 +299,61 @@ def generate_app_env_treemap(df, column_prefix, title):
 	fig.update_traces(textinfo="label+value+percent parent")
 	return fig
 
-def get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit):
-	pce = PolicyComputeEngine(pce_host, port=port, org_id=org_id)
+VIEWS = {
+	'top_talkers': lambda df, top_n: generate_top_talkers(df, top_n),
+	'top_destinations': lambda df, top_n: generate_top_destinations(df, top_n),
+	'top_ports': lambda df, top_n: generate_top_ports(df, top_n),
+	'ip_protocol_treemap': lambda df, top_n: generate_ip_protocol_treemap(df),
+	'top_app_group_sources': lambda df, top_n: generate_top_app_group_sources(df, top_n),
+	'top_app_group_destinations': lambda df, top_n: generate_top_app_group_destinations(df, top_n),
+	'top_talking_app_env_treemap': lambda df, top_n: generate_app_env_treemap(df, 'src', "Top Talking App/Env Tuples"),
+	'top_receiving_app_env_treemap': lambda df, top_n: generate_app_env_treemap(df, 'dst', "Top Receiving App/Env Tuples"),
+}
+
+DIAGRAM_TYPES = ['sankey', 'sunburst', 'graphviz']
+
+def connect_pce(pce_host, port, org_id, api_key, api_secret, retries=5):
+	pce = disable_session_retries(PolicyComputeEngine(pce_host, port=port, org_id=org_id))
 	pce.set_credentials(api_key, api_secret)
 
-	if not pce.check_connection():
-		click.echo("Connection to PCE failed.")
-		return None
+	try:
+		with_retries(pce.must_connect, retries, "PCE connection check")
+	except Exception as e:
+		raise click.ClickException(f"Connection to PCE failed: {e}")
+	return pce
+
+def get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit, shard_days=0, checkpoint_dir=None, retries=5, filter_spec=None):
+	pce = connect_pce(pce_host, port, org_id, api_key, api_secret, retries)
+	return get_pce_traffic(pce, start, end, limit, shard_days, checkpoint_dir, retries, filter_spec)
+
+def get_pce_traffic(pce, start, end, limit, shard_days=0, checkpoint_dir=None, retries=5, filter_spec=None):
+	return to_dataframe(get_pce_flows(pce, start, end, limit, shard_days, checkpoint_dir, retries, filter_spec))
+
+def get_pce_flows(pce, start, end, limit, shard_days=0, checkpoint_dir=None, retries=5, filter_spec=None):
+	# batch workers fetch several PCEs in one process and label hrefs are only unique per PCE
+	label_href_map.clear()
+	value_href_map.clear()
 
-	for l in pce.labels.get():
+	for l in with_retries(pce.labels.get, retries, "Label fetch"):
 		label_href_map[l.href] = {"key": l.key, "value": l.value}
 		value_href_map["{}={}".format(l.key, l.value)] = l.href
 	d_end = parse_date(end) if end != 'today' else datetime.now()
 	d_start = parse_date(start)
+	query_filters = build_query_filters(filter_spec, value_href_map, pce)
+
+	try:
+		all_traffic = fetch_traffic_flows(
+			pce, d_start, d_end, limit,
+			query_filters=query_filters,
+			checkpoint_dir=checkpoint_dir,
+			shard_days=shard_days,
+			retries=retries
+		)
+	except Exception as e:
+		hint = f" Completed shards are kept in {checkpoint_dir}; rerun to resume." if checkpoint_dir else ""
+		raise click.ClickException(f"Fetching traffic failed: {e}.{hint}")
 
-	traffic_query = TrafficQuery.build(
-		start_date=d_start.strftime("%Y-%m-%d"),
-		end_date=d_end.strftime("%Y-%m-%d"),
-		include_services=[],
-		exclude_services=[
-			{"port": 53},
-			{"port": 137},
-			{"port": 138},
-			{"port": 139},
-			{"proto": "udp"}
-		],
-		exclude_destinations=[
-			{"transmission": "broadcast"},
-			{"transmission": "multicast"}
-		],
-		policy_decisions=['allowed', 'potentially_blocked'],
-		max_results=limit
-	)
-
-	all_traffic = pce.get_traffic_flows_async(
-		query_name='all-traffic',
-		traffic_query=traffic_query
-	)
-
-	df = to_dataframe(all_traffic)
-	return(df)
+	return all_traffic
 
 @click.group()
 def cli():
@@ -349,21 +366,16 @@ def cli():
 @click.option('--format', type=click.Choice(['html', 'png', 'jpg', 'svg']), default='html', help='Output format')
 @click.option('--diagram-type', type=click.Choice(['sankey', 'sunburst', 'graphviz']), default='sankey', help='Diagram type')
 @click.option('--direction', type=click.Choice(['LR', 'TB']), default='LR', help='Flow directed graph orientation (LR left-right, TB top-bottom)')
-def traffic(pce_host, port, org_id, api_key, api_secret, start, end, output, format, diagram_type, direction, limit):
+def traffic(pce_host, port, org_id, api_key, api_secret, start, end, output, format, diagram_type, direction, limit, **fetch_options):
 	"""Generate traffic graph based on Illumio PCE data."""
 	global label_href_map
 	global value_href_map
 
-	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit)
+	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit, **fetch_options)
 	content = generate_traffic_graph(df, diagram_type, format, direction)
 	
 	filename = f"{output}.{format}"
-	if format == 'html':
-		with open(filename, 'w') as f:
-			f.write(content)
-	else:
-		with open(filename, 'wb') as f:
-			f.write(content)
+	save_content(content, filename)
 	
 	click.echo(f"Traffic graph saved as {filename}")
 
@@ -372,20 +384,16 @@ def traffic(pce_host, port, org_id, api_key, api_secret, start, end, output, for
 @click.option('--output', default='traffic_analysis', help='Output filename prefix')
 @click.option('--format', type=click.Choice(['html', 'png', 'jpg', 'svg']), default='html', help='Output format')
 @click.option('--top-n', default=10, help='Number of top items to show')
-def analyze(pce_host, port, org_id, api_key, api_secret, start, end, output, limit, format, top_n):
+def analyze(pce_host, port, org_id, api_key, api_secret, start, end, output, limit, format, top_n, **fetch_options):
 	"""Analyze traffic data and generate Top X views and treemap."""
 	global label_href_map
 	global value_href_map
 
-	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit)
-	views = {
-		'top_talkers': generate_top_talkers(df, top_n),
-		'top_destinations': generate_top_destinations(df, top_n),
-		'top_ports': generate_top_ports(df, top_n),
-		'ip_protocol_treemap': generate_ip_protocol_treemap(df),
-		'top_app_group_sources': generate_top_app_group_sources(df, top_n),
-		'top_app_group_destinations': generate_top_app_group_destinations(df, top_n)
-	}
+	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit, **fetch_options)
+	views = {name: VIEWS[name](df, top_n) for name in [
+		'top_talkers', 'top_destinations', 'top_ports', 'ip_protocol_treemap',
+		'top_app_group_sources', 'top_app_group_destinations'
+	]}
 	
 	# Save all views
 	for name, fig in views.items():
@@ -396,6 +404,14 @@ def analyze(pce_host, port, org_id, api_key, api_secret, start, end, output, lim
 			fig.write_image(filename)
 		click.echo(f"Saved {name} as {filename}")
 
+def save_content(content, filename):
+	if isinstance(content, str):
+		with open(filename, 'w') as f:
+			f.write(content)
+	else:
+		with open(filename, 'wb') as f:
+			f.write(content)
+
 def save_figure(fig, output, format):
 	filename = f"{output}.{format}"
 	if format == 'html':
@@ -410,9 +426,9 @@ def save_figure(fig, output, format):
 @click.option('--output', default='top_talkers', help='Output filename (without extension)')
 @click.option('--format', type=click.Choice(['html', 'png', 'jpg', 'svg']), default='html', help='Output format')
 @click.option('--top-n', default=10, help='Number of top items to show')
-def top_talkers(pce_host, port, org_id, api_key, api_secret, start, end, output, limit, format, top_n):
+def top_talkers(pce_host, port, org_id, api_key, api_secret, start, end, output, limit, format, top_n, **fetch_options):
 	"""Generate a graph of top talkers."""
-	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit)
+	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit, **fetch_options)
 	if df is not None:
 		fig = generate_top_x(df, 'src_ip', top_n, f"Top {top_n} Talkers")
 		save_figure(fig, output, format)
@@ -422,9 +438,9 @@ def top_talkers(pce_host, port, org_id, api_key, api_secret, start, end, output,
 @click.option('--output', default='top_destinations', help='Output filename (without extension)')
 @click.option('--format', type=click.Choice(['html', 'png', 'jpg', 'svg']), default='html', help='Output format')
 @click.option('--top-n', default=10, help='Number of top items to show')
-def top_destinations(pce_host, port, org_id, api_key, api_secret, start, end, output, format, top_n):
+def top_destinations(pce_host, port, org_id, api_key, api_secret, start, end, output, limit, format, top_n, **fetch_options):
 	"""Generate a graph of top destinations."""
-	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit)
+	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit, **fetch_options)
 	if df is not None:
 		fig = generate_top_x(df, 'dst_ip', top_n, f"Top {top_n} Destinations")
 		save_figure(fig, output, format)
@@ -434,9 +450,9 @@ def top_destinations(pce_host, port, org_id, api_key, api_secret, start, end, ou
 @click.option('--output', default='top_ports', help='Output filename (without extension)')
 @click.option('--format', type=click.Choice(['html', 'png', 'jpg', 'svg']), default='html', help='Output format')
 @click.option('--top-n', default=10, help='Number of top items to show')
-def top_ports(pce_host, port, org_id, api_key, api_secret, start, end, output, limit, format, top_n):
+def top_ports(pce_host, port, org_id, api_key, api_secret, start, end, output, limit, format, top_n, **fetch_options):
 	"""Generate a graph of top ports used in the environment."""
-	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit)
+	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit, **fetch_options)
 	if df is not None:
 		fig = generate_top_x(df, 'port', top_n, f"Top {top_n} Ports")
 		save_figure(fig, output, format)
@@ -445,9 +461,9 @@ def top_ports(pce_host, port, org_id, api_key, api_secret, start, end, output, l
 @global_options
 @click.option('--output', default='ip_protocol_treemap', help='Output filename (without extension)')
 @click.option('--format', type=click.Choice(['html', 'png', 'jpg', 'svg']), default='html', help='Output format')
-def ip_protocol_treemap(pce_host, port, org_id, api_key, api_secret, start, end, limit, output, format):
+def ip_protocol_treemap(pce_host, port, org_id, api_key, api_secret, start, end, limit, output, format, **fetch_options):
 	"""Generate a treemap for IP protocols containing the most used ports."""
-	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit)
+	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit, **fetch_options)
 	if df is not None:
 		fig = generate_treemap(df, "IP Protocols and Most Used Ports")
 		save_figure(fig, output, format)
@@ -457,9 +473,9 @@ def ip_protocol_treemap(pce_host, port, org_id, api_key, api_secret, start, end,
 @click.option('--output', default='top_app_group_sources', help='Output filename (without extension)')
 @click.option('--format', type=click.Choice(['html', 'png', 'jpg', 'svg']), default='html', help='Output format')
 @click.option('--top-n', default=10, help='Number of top items to show')
-def top_app_group_sources(pce_host, port, org_id, api_key, api_secret, start, end, limit, output, format, top_n):
+def top_app_group_sources(pce_host, port, org_id, api_key, api_secret, start, end, limit, output, format, top_n, **fetch_options):
 	"""Generate a graph of top app group sources."""
-	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit)
+	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit, **fetch_options)
 	if df is not None:
 		df['src_app_group'] = df['src_app'] + ' (' + df['src_env'] + ')'
 		fig = generate_top_x(df, 'src_app_group', top_n, f"Top {top_n} App Group Sources")
@@ -470,9 +486,9 @@ def top_app_group_sources(pce_host, port, org_id, api_key, api_secret, start, en
 @click.option('--output', default='top_app_group_destinations', help='Output filename (without extension)')
 @click.option('--format', type=click.Choice(['html', 'png', 'jpg', 'svg']), default='html', help='Output format')
 @click.option('--top-n', default=10, help='Number of top items to show')
-def top_app_group_destinations(pce_host, port, org_id, api_key, api_secret, start, end, limit, output, format, top_n):
+def top_app_group_destinations(pce_host, port, org_id, api_key, api_secret, start, end, limit, output, format, top_n, **fetch_options):
 	"""Generate a graph of top app group destinations."""
-	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit)
+	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit, **fetch_options)
 	if df is not None:
 		df['dst_app_group'] = df['dst_app'] + ' (' + df['dst_env'] + ')'
 		fig = generate_top_x(df, 'dst_app_group', top_n, f"Top {top_n} App Group Destinations")
@@ -481,9 +497,9 @@ def top_app_group_destinations(pce_host, port, org_id, api_key, api_secret, star
 @global_options
 @click.option('--output', default='top_talking_app_env_treemap', help='Output filename (without extension)')
 @click.option('--format', type=click.Choice(['html', 'png', 'jpg', 'svg']), default='html', help='Output format')
-def top_talking_app_env_treemap(pce_host, port, org_id, api_key, api_secret, start, end, limit, output, format):
+def top_talking_app_env_treemap(pce_host, port, org_id, api_key, api_secret, start, end, limit, output, format, **fetch_options):
 	"""Generate a treemap of the app/env tuples talking the most."""
-	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit)
+	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit, **fetch_options)
 	if df is not None:
 		fig = generate_app_env_treemap(df, 'src', "Top Talking App/Env Tuples")
 		save_figure(fig, output, format)
@@ -492,12 +508,96 @@ def top_talking_app_env_treemap(pce_host, port, org_id, api_key, api_secret, sta
 @global_options
 @click.option('--output', default='top_receiving_app_env_treemap', help='Output filename (without extension)')
 @click.option('--format', type=click.Choice(['html', 'png', 'jpg', 'svg']), default='html', help='Output format')
-def top_receiving_app_env_treemap(pce_host, port, org_id, api_key, api_secret, start, end, limit, output, format):
+def top_receiving_app_env_treemap(pce_host, port, org_id, api_key, api_secret, start, end, limit, output, format, **fetch_options):
 	"""Generate a treemap of the app/env tuples receiving the most traffic."""
-	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit)
+	df = get_traffic_data(pce_host, port, org_id, api_key, api_secret, start, end, limit, **fetch_options)
 	if df is not None:
 		fig = generate_app_env_treemap(df, 'dst', "Top Receiving App/Env Tuples")
 		save_figure(fig, output, format)
 		
+def run_batch_job(job):
+	"""Fetch and render one org of a batch manifest; runs in a worker process."""
+	result = {'pce': job['pce'], 'org': job['org'], 'outputs': [], 'errors': [], 'error': None}
+	started = time.perf_counter()
+	try:
+		df = get_traffic_data(
+			job['pce_host'], job['port'], job['org_id'], job['api_key'], job['api_secret'],
+			job['start'], job['end'], job['limit'],
+			shard_days=job['shard_days'], checkpoint_dir=job['checkpoint_dir'], retries=job['retries'],
+			filter_spec=job['filters']
+		)
+	except Exception as e:
+		result['error'] = str(e)
+		result['fetch_seconds'] = round(time.perf_counter() - started, 2)
+		return result
+	# rendering does not touch the PCE, let the next org of this PCE start fetching
+	if job.get('fetch_done') is not None:
+		job['fetch_done'].put((job['pce'], job['org']))
+	result['flows'] = len(df)
+	result['fetch_seconds'] = round(time.perf_counter() - started, 2)
+
+	started = time.perf_counter()
+	os.makedirs(job['output_dir'], exist_ok=True)
+	for view in job['views']:
+		filename = os.path.join(job['output_dir'], f"{view}.{job['format']}")
+		try:
+			if view in DIAGRAM_TYPES:
+				content = generate_traffic_graph(df.copy(), view, job['format'], job['direction'])
+			else:
+				fig = VIEWS[view](df.copy(), job['top_n'])
+				if fig is None:
+					raise ValueError("required label columns are missing")
+				content = export_plotly(fig, job['format'])
+			save_content(content, filename)
+			result['outputs'].append((view, filename))
+		except Exception as e:
+			result['errors'].append(f"{view}: {e}")
+	result['render_seconds'] = round(time.perf_counter() - started, 2)
+	return result
+
+@cli.command()
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('--output-dir', default=None, help='Output directory (overrides the manifest)')
+@click.option('--workers', type=click.IntRange(min=1), default=None, help='Worker processes (default: manifest value or CPU count)')
+def batch(manifest, output_dir, workers):
+	"""Fetch and render views for many PCEs and orgs from a YAML/JSON manifest."""
+	results = run_batch(manifest, run_batch_job, list(VIEWS) + DIAGRAM_TYPES, output_dir=output_dir, workers=workers)
+	failed = [r for r in results if r['error'] or r.get('errors')]
+	if failed:
+		raise click.ClickException(f"{len(failed)} of {len(results)} org(s) failed or had render errors, see index.json")
+
+@cli.command()
+@pce_options(required=False)
+# the server keeps a warm table for dashboards, so fetch far more than a one-off graph
+@query_options(limit=100000)
+@click.option('--host', 'bind', default='127.0.0.1', help='Address to listen on')
+@click.option('--http-port', type=int, default=8080, help='Port to listen on')
+@click.option('--refresh-interval', type=click.IntRange(min=10), default=900, help='Seconds between background refreshes of the flow table')
+@click.option('--cache-size', type=click.IntRange(min=1), default=256, help='Number of computed views (filter combinations) to keep')
+@click.option('--allow-origin', default=None, help='Let this origin (e.g. https://dashboard.example.com, or *) read the API cross-origin; off by default since the data is unauthenticated')
+@click.option('--mock-pce', type=int, default=None, help='Serve this many synthetic flows from a mock PCE instead of connecting to one')
+def serve(pce_host, port, org_id, api_key, api_secret, start, end, limit, bind, http_port, refresh_interval, cache_size, allow_origin, mock_pce, **fetch_options):
+	"""Serve cached traffic views as JSON, refreshing the data in the background."""
+	if fetch_options['checkpoint_dir']:
+		# shards are keyed by their dates, so every refresh would reload the same checkpoints
+		raise click.UsageError("--checkpoint-dir cannot be used with serve, refreshes would never see new flows")
+	if mock_pce is not None:
+		pce = MockPolicyComputeEngine(flows=mock_pce)
+	else:
+		missing = [name for name, value in [('--pce-host', pce_host), ('--port', port), ('--org-id', org_id), ('--api-key', api_key), ('--api-secret', api_secret)] if not value]
+		if missing:
+			raise click.UsageError(f"Missing {', '.join(missing)} (or use --mock-pce)")
+		# one session for the lifetime of the server
+		pce = connect_pce(pce_host, port, org_id, api_key, api_secret, fetch_options['retries'])
+
+	run_server(
+		# the server keeps the compact store resident and decodes columns per view
+		lambda: to_flow_store(get_pce_flows(pce, start, end, limit, **fetch_options)),
+		host=bind, port=http_port, refresh_interval=refresh_interval,
+		cache_size=cache_size, allow_origin=allow_origin,
+		# the web front end, so the dashboard can be opened straight from the server
+		index_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'index.html')
+	)
+
 if __name__ == '__main__':
 	cli()
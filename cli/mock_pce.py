@@ -0,0 +1,77 @@
+import random
+from illumio import Label, IPList, Workload, ServicePort, TrafficFlow, TrafficNode, TimestampRange
+
+class _LabelsAPI:
+	def __init__(self, labels):
+		self._labels = labels
+
+	def get(self, **kwargs):
+		return list(self._labels)
+
+class _IPListsAPI:
+	def __init__(self, ip_lists):
+		self._ip_lists = ip_lists
+
+	def get_by_name(self, name, **kwargs):
+		return next((l for l in self._ip_lists if l.name == name), None)
+
+class MockPolicyComputeEngine:
+	"""Stands in for PolicyComputeEngine with synthetic labels and flows, for running locally."""
+
+	def __init__(self, flows=20000, workloads=500, org_id=1, seed=0):
+		self.base_url = 'mock://pce'
+		self.org_id = org_id
+		rng = random.Random(seed)
+
+		labels = []
+		for key, values in (
+			('app', [f"app-{i}" for i in range(40)]),
+			('env', ['prod', 'staging', 'dev']),
+			('loc', ['emea', 'amer', 'apac']),
+			('role', ['web', 'app', 'db', 'cache'])
+		):
+			for value in values:
+				labels.append(Label(href=f"/orgs/{org_id}/labels/{len(labels) + 1}", key=key, value=value))
+		self.labels = _LabelsAPI(labels)
+		self.ip_lists = _IPListsAPI([IPList(href=f"/orgs/{org_id}/sec_policy/active/ip_lists/1", name='Any (0.0.0.0/0 and ::/0)')])
+
+		by_key = {}
+		for l in labels:
+			by_key.setdefault(l.key, []).append(l)
+		hosts = []
+		for i in range(workloads):
+			workload = Workload(
+				href=f"/orgs/{org_id}/workloads/{i}",
+				name=f"host-{i:04d}",
+				labels=[Label(href=rng.choice(ls).href) for ls in by_key.values()]
+			)
+			hosts.append((f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}", workload))
+		services = [(22, 'sshd'), (80, 'nginx'), (443, 'nginx'), (3306, 'mysqld'), (5432, 'postgres'), (6379, 'redis-server'), (8080, 'java')]
+		timestamp_range = TimestampRange(first_detected='2024-07-01T00:00:00Z', last_detected='2024-07-30T00:00:00Z')
+
+		# build the objects directly, TrafficFlow.from_json is far too slow for large mock tables
+		self._flows = []
+		for _ in range(flows):
+			(src_ip, src), (dst_ip, dst) = rng.choice(hosts), rng.choice(hosts)
+			port, process = rng.choice(services)
+			self._flows.append(TrafficFlow(
+				src=TrafficNode(ip=src_ip, workload=src),
+				dst=TrafficNode(ip=dst_ip, workload=dst),
+				service=ServicePort(port=port, proto=6, process_name=process),
+				num_connections=rng.randint(1, 500),
+				policy_decision=rng.choice(['allowed', 'potentially_blocked', 'blocked']),
+				flow_direction='inbound',
+				timestamp_range=timestamp_range
+			))
+
+	def must_connect(self, **kwargs):
+		pass
+
+	def check_connection(self, **kwargs):
+		return True
+
+	def get_traffic_flows_async(self, query_name, traffic_query, **kwargs):
+		# only policy decisions and max_results are applied, which is enough to exercise the pipeline
+		decisions = set(traffic_query.policy_decisions)
+		flows = [f for f in self._flows if not decisions or f.policy_decision in decisions]
+		return flows[:traffic_query.max_results]
@@ -0,0 +1,210 @@
+import os
+import copy
+import json
+import dataclasses
+import hashlib
+from datetime import date, datetime, time
+import click
+import requests
+from requests.adapters import HTTPAdapter
+from illumio import TrafficQuery, TrafficFlow
+from query_filters import DEFAULT_QUERY_FILTERS
+from tenacity import Retrying, stop_after_attempt, wait_random_exponential, retry_if_exception
+
+# statuses worth another attempt; any other 4xx means the query itself is wrong
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# errors without a response that are worth another attempt
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.RetryError)
+
+def _exception_chain(exc):
+	# illumio wraps the requests error (sometimes twice), so walk the chain
+	seen = set()
+	while exc is not None and id(exc) not in seen:
+		seen.add(id(exc))
+		yield exc
+		exc = exc.__cause__ or exc.__context__
+
+def _find_response(exc):
+	for e in _exception_chain(exc):
+		response = getattr(e, 'response', None)
+		if response is not None:
+			return response
+	return None
+
+def disable_session_retries(pce):
+	# PolicyComputeEngine mounts a urllib3 Retry on its session, which would nest
+	# under with_retries and turn 429/5xx into a RetryError without a response
+	adapter = HTTPAdapter(max_retries=0)
+	pce._session.mount('https://', adapter)
+	pce._session.mount('http://', adapter)
+	return pce
+
+def is_retryable(exc):
+	response = _find_response(exc)
+	if response is not None:
+		return response.status_code in RETRYABLE_STATUS
+	for e in _exception_chain(exc):
+		if isinstance(e, TRANSIENT_ERRORS):
+			return True
+		# illumio raises a bare Exception when the PCE reports the async job as failed
+		if str(e).startswith('Async collection job failed'):
+			return True
+	return False
+
+class wait_for_pce(wait_random_exponential):
+	"""Jittered exponential backoff that honours the PCE's Retry-After header."""
+
+	def __call__(self, retry_state):
+		exc = retry_state.outcome.exception()
+		response = _find_response(exc)
+		if response is not None and response.status_code == 429:
+			retry_after = response.headers.get('Retry-After')
+			if retry_after is not None and retry_after.isdigit():
+				return float(retry_after)
+		return super().__call__(retry_state)
+
+def with_retries(fn, retries, description):
+	def log_retry(retry_state):
+		click.echo(
+			f"{description} failed (attempt {retry_state.attempt_number}/{retries}): "
+			f"{retry_state.outcome.exception()}; retrying in {retry_state.next_action.sleep:.1f}s"
+		)
+
+	retrying = Retrying(
+		stop=stop_after_attempt(retries),
+		wait=wait_for_pce(multiplier=2, max=300),
+		retry=retry_if_exception(is_retryable),
+		before_sleep=log_retry,
+		reraise=True
+	)
+	return retrying(fn)
+
+def query_shards(d_start, d_end, shard_days):
+	if not shard_days:
+		return [(d_start, d_end)]
+	# whole-day windows on a fixed grid, so a run resumed on a later day (when a
+	# relative --start has moved) still produces the same shard keys
+	start = datetime.combine(d_start.date(), time.min)
+	end = datetime.combine(d_end.date(), time.min)
+	shards = []
+	current = start
+	while current < end:
+		boundary = date.fromordinal((current.toordinal() // shard_days + 1) * shard_days)
+		shard_end = min(datetime.combine(boundary, time.min), end)
+		shards.append((current, shard_end))
+		current = shard_end
+	return shards or [(start, end)]
+
+def checkpoint_path(checkpoint_dir, pce_host, org_id, limit, query_filters):
+	# shards are keyed by their own window, so only the query shape goes in the
+	# fingerprint and a resumed run with a later --end reuses the earlier shards
+	fingerprint = hashlib.sha256(json.dumps(
+		{'pce_host': pce_host, 'org_id': str(org_id), 'limit': limit, 'filters': query_filters},
+		sort_keys=True
+	).encode()).hexdigest()[:16]
+	path = os.path.join(checkpoint_dir, fingerprint)
+	os.makedirs(path, exist_ok=True)
+	return path
+
+def load_shard(filename):
+	with open(filename) as f:
+		return [TrafficFlow.from_json(flow) for flow in json.load(f)]
+
+def save_shard(filename, flows):
+	tmp_filename = filename + '.tmp'
+	with open(tmp_filename, 'w') as f:
+		json.dump([flow.to_json() for flow in flows], f)
+	os.replace(tmp_filename, filename)
+
+def fetch_shard(pce, shard_start, shard_end, limit, query_filters, retries):
+	start_date = shard_start.strftime("%Y-%m-%d")
+	end_date = shard_end.strftime("%Y-%m-%d")
+
+	# build outside the retried call, an invalid query should fail straight away
+	traffic_query = TrafficQuery.build(
+		start_date=start_date,
+		end_date=end_date,
+		max_results=limit,
+		**query_filters
+	)
+
+	def run_query():
+		return pce.get_traffic_flows_async(
+			query_name=f'all-traffic-{start_date}-{end_date}',
+			traffic_query=traffic_query
+		)
+
+	return with_retries(run_query, retries, f"Traffic query {start_date} - {end_date}")
+
+def traffic_flow_unique_name(flow):
+	return "{}-{}_{}-{}_{}".format(
+		flow.src.ip,
+		flow.dst.ip,
+		flow.service.port,
+		flow.service.proto,
+		flow.flow_direction
+	)
+
+def _detected(value):
+	return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def merge_flows(flows):
+	"""Fold flows with the same traffic_flow_unique_name into one.
+
+	Explorer aggregates each flow over its query window, so a connection active
+	in several shards comes back once per shard. Counters are summed and the
+	timestamp range widened, so sharding only splits the fetch.
+	"""
+	merged = {}
+	copied = set()
+	for flow in flows:
+		key = traffic_flow_unique_name(flow)
+		first = merged.get(key)
+		if first is None:
+			merged[key] = flow
+			continue
+		if key not in copied:
+			# never modify the fetched objects, they may be shared or checkpointed
+			first = merged[key] = dataclasses.replace(first, timestamp_range=copy.copy(first.timestamp_range))
+			copied.add(key)
+		for counter in ('num_connections', 'dst_bi', 'dst_bo'):
+			if getattr(flow, counter) is not None:
+				setattr(first, counter, (getattr(first, counter) or 0) + getattr(flow, counter))
+		if first.timestamp_range is None:
+			first.timestamp_range = flow.timestamp_range
+		elif flow.timestamp_range is not None:
+			ours, theirs = first.timestamp_range, flow.timestamp_range
+			if _detected(theirs.first_detected) < _detected(ours.first_detected):
+				ours.first_detected = theirs.first_detected
+			if _detected(theirs.last_detected) > _detected(ours.last_detected):
+				ours.last_detected = theirs.last_detected
+	return list(merged.values())
+
+def fetch_traffic_flows(pce, d_start, d_end, limit, query_filters=None, checkpoint_dir=None, shard_days=0, retries=5):
+	query_filters = DEFAULT_QUERY_FILTERS if query_filters is None else query_filters
+	shards = query_shards(d_start, d_end, shard_days)
+	shard_dir = None
+	if checkpoint_dir:
+		shard_dir = checkpoint_path(checkpoint_dir, pce.base_url, pce.org_id, limit, query_filters)
+
+	all_traffic = []
+	for i, (shard_start, shard_end) in enumerate(shards, 1):
+		shard_file = None
+		if shard_dir:
+			shard_file = os.path.join(shard_dir, "{}_{}.json".format(
+				shard_start.strftime("%Y-%m-%d"), shard_end.strftime("%Y-%m-%d")
+			))
+			if os.path.exists(shard_file):
+				flows = load_shard(shard_file)
+				click.echo(f"Shard {i}/{len(shards)}: loaded {len(flows)} flows from checkpoint")
+				all_traffic.extend(flows)
+				continue
+
+		flows = fetch_shard(pce, shard_start, shard_end, limit, query_filters, retries)
+		click.echo(f"Shard {i}/{len(shards)}: fetched {len(flows)} flows")
+		if shard_file:
+			save_shard(shard_file, flows)
+		all_traffic.extend(flows)
+
+	return merge_flows(all_traffic) if len(shards) > 1 else all_traffic
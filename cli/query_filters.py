@@ -0,0 +1,179 @@
+import re
+import ipaddress
+import click
+from illumio import convert_protocol, Transmission
+from config import read_config
+
+DEFAULT_EXCLUDE_SERVICES = [
+	{"port": 53},
+	{"port": 137},
+	{"port": 138},
+	{"port": 139},
+	{"proto": "udp"}
+]
+
+DEFAULT_EXCLUDE_DESTINATIONS = [
+	{"transmission": "broadcast"},
+	{"transmission": "multicast"}
+]
+
+POLICY_DECISIONS = ['allowed', 'potentially_blocked', 'blocked', 'unknown']
+DEFAULT_POLICY_DECISIONS = ['allowed', 'potentially_blocked']
+
+DEFAULT_QUERY_FILTERS = {
+	'include_services': [],
+	'exclude_services': DEFAULT_EXCLUDE_SERVICES,
+	'exclude_destinations': DEFAULT_EXCLUDE_DESTINATIONS,
+	'policy_decisions': DEFAULT_POLICY_DECISIONS,
+}
+
+# keys of a filter spec; the same names TrafficQuery.build takes
+SELECTOR_KEYS = ('include_sources', 'exclude_sources', 'include_destinations', 'exclude_destinations')
+SERVICE_KEYS = ('include_services', 'exclude_services')
+FILTER_KEYS = SELECTOR_KEYS + SERVICE_KEYS + ('policy_decisions', 'default_excludes')
+
+SERVICE_RE = re.compile(r'^(?P<port>\d+)(?:-(?P<to_port>\d+))?(?:/(?P<proto>\w+))?$')
+
+PORT_MAX = 65535
+
+def parse_service(value):
+	"""Turn '443/tcp', '8000-8100/tcp', '53' or 'udp' into a ServicePort dict."""
+	value = str(value).strip().lower()
+	match = SERVICE_RE.match(value)
+	try:
+		if match is None:
+			return {"proto": int(value) if value.isdigit() else convert_protocol(value)}
+		service = {"port": int(match['port'])}
+		if match['to_port']:
+			service["to_port"] = int(match['to_port'])
+		if match['proto']:
+			service["proto"] = int(match['proto']) if match['proto'].isdigit() else convert_protocol(match['proto'])
+	except Exception:
+		raise click.BadParameter(f"Invalid service '{value}', expected PORT[-TO_PORT][/PROTO] or PROTO")
+	# check here rather than in TrafficQuery.build, which only runs after connecting to the PCE
+	if max(service["port"], service.get("to_port", 0)) > PORT_MAX:
+		raise click.BadParameter(f"Invalid service '{value}', ports go up to {PORT_MAX}")
+	if "to_port" in service and service["to_port"] <= service["port"]:
+		raise click.BadParameter(f"Invalid service '{value}', the end of a port range must be above its start")
+	return service
+
+def _service_ranges(service):
+	port = service.get("port")
+	ports = (0, PORT_MAX) if port is None else (port, service.get("to_port", port))
+	proto = service.get("proto")
+	return ports, convert_protocol(proto) if isinstance(proto, str) else proto
+
+def _overlaps(a, b):
+	(a_ports, a_proto), (b_ports, b_proto) = _service_ranges(a), _service_ranges(b)
+	same_proto = a_proto is None or b_proto is None or a_proto == b_proto
+	return same_proto and a_ports[0] <= b_ports[1] and b_ports[0] <= a_ports[1]
+
+def resolve_selector(selector, value_href_map, pce=None, allow_transmission=True):
+	"""Turn 'key=value', 'ipl:NAME', an IP address or a transmission type into a traffic filter.
+
+	Transmission types are only valid in excludes, the PCE rejects them as consumer filters.
+	"""
+	selector = selector.strip()
+	if selector.startswith('ipl:'):
+		name = selector[4:]
+		ip_list = pce.ip_lists.get_by_name(name, policy_version='active') if pce is not None else None
+		if ip_list is None:
+			raise click.ClickException(f"Unknown IP list: {name}")
+		return {"ip_list": {"href": ip_list.href}}
+	if '=' in selector:
+		if selector not in value_href_map:
+			raise click.ClickException(f"Unknown label: {selector}")
+		return {"label": {"href": value_href_map[selector]}}
+	if selector in Transmission:
+		if not allow_transmission:
+			raise click.ClickException(f"'{selector}' can only be used to exclude traffic")
+		return {"transmission": selector}
+	try:
+		ipaddress.ip_address(selector)
+	except ValueError:
+		raise click.ClickException(f"Invalid selector '{selector}', expected key=value, ipl:NAME, an IP address or a transmission type")
+	return {"ip_address": selector}
+
+def _groups(values):
+	# a string is a group of one, a list is an AND group
+	return [v if isinstance(v, list) else [v] for v in values]
+
+def build_query_filters(spec, value_href_map, pce=None):
+	"""Resolve a filter spec into TrafficQuery.build keyword arguments.
+
+	Include selectors are lists of AND groups that are OR'ed together,
+	excludes are flat lists. Unless `default_excludes` is false the usual
+	noise (DNS, NetBIOS, UDP, broadcast and multicast) is excluded as well,
+	except for default service excludes overlapping an included service.
+	"""
+	spec = spec or {}
+	filters = {}
+	for key in SELECTOR_KEYS:
+		values = spec.get(key, [])
+		if key.startswith('include'):
+			groups = [[resolve_selector(s, value_href_map, pce, allow_transmission=False) for s in group] for group in _groups(values)]
+			if groups:
+				filters[key] = groups
+		else:
+			filters[key] = [resolve_selector(s, value_href_map, pce) for s in values]
+	for key in SERVICE_KEYS:
+		filters[key] = [parse_service(s) for s in spec.get(key, [])]
+	filters['policy_decisions'] = list(spec.get('policy_decisions') or DEFAULT_POLICY_DECISIONS)
+
+	if spec.get('default_excludes', True):
+		# a default exclude that covers an explicitly included service (e.g. udp for
+		# --service 53/udp) would empty the query, so it gives way to the include
+		default_services = [d for d in DEFAULT_EXCLUDE_SERVICES
+			if not any(_overlaps(d, s) for s in filters['include_services'])]
+		filters['exclude_services'] = default_services + filters['exclude_services']
+		filters['exclude_destinations'] = DEFAULT_EXCLUDE_DESTINATIONS + filters['exclude_destinations']
+	return filters
+
+def check_filter_spec(spec, source):
+	"""Fail early on malformed filters and invalid services, before connecting to the PCE."""
+	if not isinstance(spec, dict):
+		raise click.ClickException(f"{source}: filters must be a mapping")
+	unknown = set(spec) - set(FILTER_KEYS)
+	if unknown:
+		raise click.ClickException(f"{source}: unknown keys {', '.join(sorted(unknown))}")
+	# a scalar would otherwise be iterated character by character
+	for key in SELECTOR_KEYS + SERVICE_KEYS + ('policy_decisions',):
+		if key in spec and not isinstance(spec[key], list):
+			raise click.ClickException(f"{source}: {key} must be a list, e.g. [{spec[key]!r}]")
+	for key in SELECTOR_KEYS:
+		for value in spec.get(key, []):
+			# include groups may be AND lists, excludes are flat
+			group = value if isinstance(value, list) and key.startswith('include') else [value]
+			if not all(isinstance(s, str) for s in group):
+				raise click.ClickException(f"{source}: invalid {key} entry {value!r}")
+	for service in spec.get('include_services', []) + spec.get('exclude_services', []):
+		parse_service(service)
+	invalid = set(spec.get('policy_decisions', [])) - set(POLICY_DECISIONS)
+	if invalid:
+		raise click.ClickException(
+			f"{source}: invalid policy_decisions {', '.join(sorted(map(str, invalid)))}, expected {', '.join(POLICY_DECISIONS)}"
+		)
+	if not isinstance(spec.get('default_excludes', True), bool):
+		raise click.ClickException(f"{source}: default_excludes must be true or false")
+	return spec
+
+def filter_spec_from_options(profile=None, src=(), dst=(), exclude_src=(), exclude_dst=(),
+		service=(), exclude_service=(), policy_decision=(), no_default_excludes=False):
+	"""Merge a profile file with the command line filter options; the command line adds to the profile."""
+	spec = dict(check_filter_spec(read_config(profile), profile)) if profile else {}
+
+	def split(values):
+		return [v.strip() for value in values for v in value.split(',') if v.strip()]
+
+	# each --src/--dst value is one AND group, excludes are plain lists
+	spec['include_sources'] = list(spec.get('include_sources', [])) + [split([v]) for v in src]
+	spec['include_destinations'] = list(spec.get('include_destinations', [])) + [split([v]) for v in dst]
+	spec['exclude_sources'] = list(spec.get('exclude_sources', [])) + split(exclude_src)
+	spec['exclude_destinations'] = list(spec.get('exclude_destinations', [])) + split(exclude_dst)
+	spec['include_services'] = list(spec.get('include_services', [])) + split(service)
+	spec['exclude_services'] = list(spec.get('exclude_services', [])) + split(exclude_service)
+	if policy_decision:
+		spec['policy_decisions'] = list(policy_decision)
+	if no_default_excludes:
+		spec['default_excludes'] = False
+	return check_filter_spec(spec, profile or 'command line')
@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qsl
+import click
+
+# seconds a client gets to send its request line and headers
+READ_TIMEOUT = 30
+
+# parameters that configure a view; every other query parameter filters the flow table
+VIEW_PARAMS = {'column', 'n', 'levels'}
+
+# warmed for every new flow table so the first dashboard load is a cache hit
+DEFAULT_VIEWS = [
+	('top', (('column', 'src_ip'),)),
+	('top', (('column', 'dst_ip'),)),
+	('top', (('column', 'port'),)),
+	('treemap', (('levels', 'proto,port'),)),
+	('treemap', (('levels', 'src_env,src_app'),)),
+	('treemap', (('levels', 'dst_env,dst_app'),)),
+	('sankey', ()),
+]
+
+class ViewError(Exception):
+	pass
+
+def _require(df, columns):
+	missing = [c for c in columns if c not in df.columns]
+	if missing:
+		raise ViewError(f"Unknown columns: {', '.join(missing)}")
+
+def apply_filters(df, filters):
+	for column, value in filters.items():
+		_require(df, [column])
+		values = value.split(',')
+		df = df[df[column].astype(str).isin(values)]
+	return df
+
+def top_view(df, column='src_ip', n='10'):
+	_require(df, [column])
+	counts = df[column].value_counts().nlargest(int(n))
+	return [{'value': value, 'count': int(count)} for value, count in counts.items()]
+
+def treemap_view(df, levels='proto,port'):
+	levels = levels.split(',')
+	_require(df, levels)
+	counts = df.groupby(levels).size().reset_index(name='count')
+	return counts.to_dict('records')
+
+def sankey_view(df):
+	_require(df, ['src_app', 'src_env', 'dst_app', 'dst_env'])
+	src = df['src_app'] + ' (' + df['src_env'] + ')'
+	dst = df['dst_app'] + ' (' + df['dst_env'] + ')'
+	edges = (src != dst) & src.notna() & dst.notna()
+	counts = src[edges].groupby([src[edges], dst[edges]]).size()
+	return [{'source': s, 'target': t, 'value': int(v)} for (s, t), v in counts.items()]
+
+VIEWS = {'top': top_view, 'treemap': treemap_view, 'sankey': sankey_view}
+
+def view_columns(view, params):
+	"""Columns a view reads, so only those are decoded from the flow store."""
+	if view == 'top':
+		return [params.get('column', 'src_ip')]
+	if view == 'treemap':
+		return params.get('levels', 'proto,port').split(',')
+	return ['src_app', 'src_env', 'dst_app', 'dst_env']
+
+class ViewCache:
+	"""Keeps the warm flow store and an LRU of computed views keyed by filter combination.
+
+	The table stays resident in its compact FlowStore form; each view decodes
+	just the columns it filters and aggregates on.
+	"""
+
+	def __init__(self, loader, refresh_interval, cache_size=256):
+		self.loader = loader
+		self.refresh_interval = refresh_interval
+		self.cache_size = cache_size
+		self.store = None
+		self.generation = 0
+		self.refreshed_at = None
+		self.refresh_seconds = None
+		self.last_error = None
+		self.views = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self._refresh_lock = asyncio.Lock()
+		self._refresh_task = None
+
+	def compute(self, store, view, params):
+		params = dict(params)
+		view_params = {k: v for k, v in params.items() if k in VIEW_PARAMS}
+		filters = {k: v for k, v in params.items() if k not in VIEW_PARAMS}
+		columns = dict.fromkeys(c for c in list(filters) + view_columns(view, view_params) if c in store.columns)
+		return VIEWS[view](apply_filters(store.to_dataframe(columns), filters), **view_params)
+
+	async def get(self, view, params):
+		if self.store is None:
+			raise ViewError("Flow data is not loaded yet")
+		key = (self.generation, view, tuple(sorted(params)))
+		if key in self.views:
+			self.hits += 1
+			self.views.move_to_end(key)
+			return self.views[key]
+		self.misses += 1
+		# a refresh may swap the table while this runs, so compute on the one the key belongs to
+		result = await asyncio.get_running_loop().run_in_executor(None, self.compute, self.store, view, key[2])
+		self._store(key, result)
+		return result
+
+	def _store(self, key, result):
+		self.views[key] = result
+		self.views.move_to_end(key)
+		while len(self.views) > self.cache_size:
+			self.views.popitem(last=False)
+
+	def _load(self):
+		started = time.perf_counter()
+		store = self.loader()
+		# aggregate the default views before swapping tables, so readers never wait on them
+		warm = {}
+		for view, params in DEFAULT_VIEWS:
+			try:
+				warm[(view, params)] = self.compute(store, view, params)
+			except ViewError:
+				pass
+		return store, warm, time.perf_counter() - started
+
+	async def refresh(self):
+		async with self._refresh_lock:
+			try:
+				store, warm, seconds = await asyncio.get_running_loop().run_in_executor(None, self._load)
+			except Exception as e:
+				self.last_error = str(e)
+				click.echo(f"Refresh failed: {e}")
+				return
+			self.store = store
+			self.generation += 1
+			self.refreshed_at = time.time()
+			self.refresh_seconds = round(seconds, 2)
+			self.last_error = None
+			self.views.clear()
+			for (view, params), result in warm.items():
+				self._store((self.generation, view, params), result)
+			click.echo(f"Refreshed {len(store)} flows ({store.nbytes / 2**20:.1f} MB resident) in {seconds:.1f}s")
+
+	def request_refresh(self):
+		if not self.refreshing:
+			self._refresh_task = asyncio.create_task(self.refresh())
+
+	async def refresh_loop(self):
+		while True:
+			await self.refresh()
+			await asyncio.sleep(self.refresh_interval)
+
+	@property
+	def refreshing(self):
+		return self._refresh_lock.locked()
+
+	def status(self):
+		return {
+			'flows': 0 if self.store is None else len(self.store),
+			'resident_bytes': 0 if self.store is None else self.store.nbytes,
+			'generation': self.generation,
+			'refreshed_at': self.refreshed_at,
+			'refresh_seconds': self.refresh_seconds,
+			'refresh_interval': self.refresh_interval,
+			'refreshing': self.refreshing,
+			'last_error': self.last_error,
+			'cached_views': len(self.views),
+			'cache_hits': self.hits,
+			'cache_misses': self.misses,
+		}
+
+HTTP_REASONS = {
+	200: 'OK', 202: 'Accepted', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found',
+	405: 'Method Not Allowed', 408: 'Request Timeout', 415: 'Unsupported Media Type',
+	500: 'Internal Server Error', 503: 'Service Unavailable'
+}
+
+async def write_response(writer, status, body=None, allow_origin=None):
+	# bytes are a page (the dashboard), anything else is sent as JSON
+	if isinstance(body, bytes):
+		payload, content_type = body, "text/html; charset=utf-8"
+	else:
+		payload, content_type = b'' if body is None else json.dumps(body, default=str).encode(), "application/json"
+	headers = [
+		f"HTTP/1.1 {status} {HTTP_REASONS[status]}",
+		f"Content-Type: {content_type}",
+		f"Content-Length: {len(payload)}",
+		"Connection: close",
+	]
+	# the data is unauthenticated, so other origins only get to read it when asked for
+	if allow_origin:
+		headers[-1:-1] = [
+			f"Access-Control-Allow-Origin: {allow_origin}",
+			"Access-Control-Allow-Headers: Content-Type",
+			"Access-Control-Allow-Methods: OPTIONS,GET,POST",
+		]
+	writer.write(("\r\n".join(headers) + "\r\n\r\n").encode() + payload)
+	await writer.drain()
+
+async def handle_request(cache, method, target, index=None, headers=None):
+	url = urlsplit(target)
+	path = url.path.rstrip('/')
+	if method == 'OPTIONS':
+		return 204, None
+	if path in ('', '/index.html') and method == 'GET' and index is not None:
+		return 200, index
+	if path == '/api/status' and method == 'GET':
+		return 200, cache.status()
+	if path == '/api/refresh' and method == 'POST':
+		# a JSON content type cannot be sent cross-origin without a CORS preflight,
+		# so other sites cannot trigger PCE refreshes with a plain form or fetch
+		if not (headers or {}).get('content-type', '').startswith('application/json'):
+			return 415, {'error': 'POST with Content-Type: application/json'}
+		cache.request_refresh()
+		return 202, cache.status()
+	if path.startswith('/api/views/'):
+		view = path[len('/api/views/'):]
+		if view not in VIEWS:
+			return 404, {'error': f"Unknown view: {view}", 'views': list(VIEWS)}
+		if method != 'GET':
+			return 405, {'error': 'Use GET'}
+		try:
+			result = await cache.get(view, parse_qsl(url.query))
+		except ViewError as e:
+			return (503 if cache.store is None else 400), {'error': str(e)}
+		except (TypeError, ValueError) as e:
+			return 400, {'error': str(e)}
+		except Exception as e:
+			# pandas can fail in many ways on user supplied filters and levels
+			click.echo(f"View {view} failed: {e!r}")
+			return 500, {'error': f"{type(e).__name__}: {e}"}
+		return 200, {'generation': cache.generation, 'data': result}
+	return 404, {'error': f"Not found: {url.path}"}
+
+async def read_request(reader):
+	request_line = (await reader.readline()).decode('latin-1').split()
+	headers = {}
+	while True:
+		line = await reader.readline()
+		if line in (b'\r\n', b'\n', b''):
+			break
+		name, _, value = line.decode('latin-1').partition(':')
+		headers[name.strip().lower()] = value.strip()
+	content_length = int(headers.get('content-length') or 0)
+	if content_length:
+		await reader.readexactly(content_length)
+	return request_line, headers
+
+def make_handler(cache, allow_origin, index=None):
+	async def handle(reader, writer):
+		try:
+			try:
+				request_line, headers = await asyncio.wait_for(read_request(reader), READ_TIMEOUT)
+			except asyncio.TimeoutError:
+				await write_response(writer, 408, {'error': 'Request timed out'}, allow_origin)
+				return
+			except ValueError:
+				request_line, headers = [], {}
+			if len(request_line) < 2:
+				await write_response(writer, 400, {'error': 'Malformed request'}, allow_origin)
+				return
+			try:
+				status, body = await handle_request(cache, request_line[0].upper(), request_line[1], index, headers)
+			except Exception as e:
+				click.echo(f"Request {request_line[1]} failed: {e!r}")
+				status, body = 500, {'error': f"{type(e).__name__}: {e}"}
+			await write_response(writer, status, body, allow_origin)
+		except (ConnectionError, asyncio.IncompleteReadError):
+			pass
+		finally:
+			writer.close()
+	return handle
+
+async def serve_forever(loader, host, port, refresh_interval, cache_size, allow_origin, index=None):
+	cache = ViewCache(loader, refresh_interval, cache_size)
+	server = await asyncio.start_server(make_handler(cache, allow_origin, index), host, port)
+	if index is not None:
+		click.echo(f"Dashboard on http://{host}:{port}/")
+	click.echo(f"Serving on http://{host}:{port}/api/views/{{top,treemap,sankey}}")
+	refresher = asyncio.create_task(cache.refresh_loop())
+	try:
+		async with server:
+			await server.serve_forever()
+	finally:
+		refresher.cancel()
+
+def run_server(loader, host='127.0.0.1', port=8080, refresh_interval=900, cache_size=256, allow_origin=None, index_path=None):
+	index = None
+	if index_path and os.path.exists(index_path):
+		with open(index_path, 'rb') as f:
+			index = f.read()
+	try:
+		asyncio.run(serve_forever(loader, host, port, refresh_interval, cache_size, allow_origin, index))
+	except KeyboardInterrupt:
+		pass
@@ -35,7 +35,7 @@ def to_dataframe(flows) -> pd.DataFrame:
 	for flow in flows:
 		# rebuild it here in a loop so to break
 		f = {}
-		f['src_ip'] = flow.src.ip,
+		f['src_ip'] = flow.src.ip
 		f['src_hostname'] = flow.src.workload.name if flow.src.workload is not None else None
 		if flow.src.workload:
 			for l in flow.src.workload.labels:
@@ -43,8 +43,8 @@ def to_dataframe(flows) -> pd.DataFrame:
 					# print(label_href_map[l.href])
 					f['src_' + label_href_map[l.href]['key']] = label_href_map[l.href]['value']
 					
-		f['dst_ip'] = flow.dst.ip,
-		f['dst_hostname'] = flow.src.workload.name if flow.src.workload is not None else None
+		f['dst_ip'] = flow.dst.ip
+		f['dst_hostname'] = flow.dst.workload.name if flow.dst.workload is not None else None
 		if flow.dst.workload:
 			for l in flow.dst.workload.labels:
 				if l.href in label_href_map: